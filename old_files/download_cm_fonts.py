@@ -1,53 +1,77 @@
 #!/usr/bin/env python3
 """
 Download Computer Modern fonts from CTAN and install them on macOS
+
+Requires the requests package (which brings in urllib3):
+    pip install requests
 """
-import urllib.request
-import ssl
-import re
 import os
+import posixpath
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Create SSL context that doesn't verify certificates (for CTAN)
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+# Certificates are not verified for CTAN, so silence urllib3's per-request warning
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # Base URL
 base_url = "https://ctan.org/tex-archive/fonts/cm/ps-type1/bakoma/otf"
 fonts_dir = os.path.expanduser("~/Library/Fonts")
+# Prefix for font paths, computed once instead of os.path.join per font
+fonts_prefix = fonts_dir + os.sep
+
+# Number of fonts downloaded concurrently (also the connection pool size)
+max_workers = 8
+
+# Chunk size used when streaming a download to disk
+chunk_size = 64 * 1024
+
+def create_session():
+    """Create a shared HTTP session so all downloads reuse one keep-alive connection"""
+    session = requests.Session()
+    session.verify = False
+    session.headers.update({'User-Agent': 'download_cm_fonts.py'})
+    # Retry transient CTAN failures with backoff instead of giving up on the font
+    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    session.mount('https://', HTTPAdapter(max_retries=retries, pool_maxsize=max_workers))
+    return session
 
-def get_font_list():
+class LinkParser(HTMLParser):
+    """Collect the href of every <a> tag in a single pass over the HTML"""
+    def __init__(self):
+        super().__init__()
+        self.hrefs = []
+    
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href' and value:
+                    self.hrefs.append(value)
+
+def get_font_list(session):
     """Get list of OTF files from CTAN directory"""
     print("Fetching directory listing...")
     try:
-        req = urllib.request.Request(base_url)
-        with urllib.request.urlopen(req, context=ssl_context) as response:
-            html = response.read().decode('utf-8')
+        response = session.get(base_url)
+        response.raise_for_status()
+        html = response.text
         
         # Save HTML for debugging (optional)
         # with open('ctan_debug.html', 'w') as f:
         #     f.write(html)
         
-        # Try multiple patterns to find .otf files
-        patterns = [
-            r'href="([^"]+\.otf)"',           # Standard href
-            r'href=\'([^\']+\.otf)\'',        # Single quotes
-            r'<a[^>]+href="([^"]+\.otf)"',    # Anchor tag with href
-            r'<a[^>]+href=\'([^\']+\.otf)\'', # Anchor tag with single quotes
-        ]
-        
-        files = set()
-        for pattern in patterns:
-            matches = re.findall(pattern, html, re.IGNORECASE)
-            files.update(matches)
+        # Extract all links in one parse, then keep the .otf filenames
+        parser = LinkParser()
+        parser.feed(html)
+        parser.close()
         
-        # Also try to find any .otf filename in the HTML
-        all_otf = re.findall(r'([a-zA-Z0-9_\-]+\.otf)', html, re.IGNORECASE)
-        files.update(all_otf)
-        
-        # Filter out any that don't look like font filenames
-        font_files = [f for f in files if f.endswith('.otf') and not f.startswith('http') and '/' not in f]
+        files = {posixpath.basename(urlsplit(href).path) for href in parser.hrefs}
+        font_files = [f for f in files if f.endswith('.otf')]
         
         if font_files:
             print(f"Found {len(font_files)} fonts in directory listing")
@@ -58,26 +82,49 @@ def get_font_list():
         print(f"Error fetching directory listing: {e}")
         return []
 
-def download_font(filename):
+def is_truncated(session, url, local_path):
+    """Check a local font against the server's Content-Length with a HEAD request"""
+    try:
+        response = session.head(url, allow_redirects=True)
+        response.raise_for_status()
+        remote_size = int(response.headers['Content-Length'])
+    except Exception:
+        # Size unknown (offline, no header): trust the existing file
+        return False
+    # Only a smaller file counts: fix_font_names.py rewrites fonts in place,
+    # so a fixed font may legitimately differ from the CTAN original
+    return os.path.getsize(local_path) < remote_size
+
+def download_font(session, filename):
     """Download a single font file"""
     url = f"{base_url}/{filename}"
-    local_path = os.path.join(fonts_dir, filename)
+    local_path = fonts_prefix + filename
     
-    # Skip if already exists
+    # Skip if already exists, unless the server reports a larger file
+    # (a download truncated by an earlier run)
     if os.path.exists(local_path):
-        print(f"  ✓ {filename} (already exists)")
-        return True
+        if not is_truncated(session, url, local_path):
+            print(f"  ✓ {filename} (already exists)")
+            return True
+        print(f"  {filename} is incomplete, downloading again")
     
+    # Stream into a .part file and rename it into place once complete,
+    # so an interrupted download never leaves a truncated font behind
+    part_path = local_path + '.part'
     try:
         print(f"  Downloading {filename}...")
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, context=ssl_context) as response:
-            with open(local_path, 'wb') as f:
-                f.write(response.read())
+        with session.get(url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with open(part_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, length=chunk_size)
+        os.replace(part_path, local_path)
         print(f"  ✓ {filename}")
         return True
     except Exception as e:
         print(f"  ✗ {filename}: {e}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
         return False
 
 def main():
@@ -85,8 +132,11 @@ def main():
     os.makedirs(fonts_dir, exist_ok=True)
     print(f"Fonts will be installed to: {fonts_dir}\n")
     
+    # One session for the directory listing and every font download
+    session = create_session()
+    
     # Get list of fonts
-    font_files = get_font_list()
+    font_files = get_font_list(session)
     
     if not font_files:
         print("No fonts found in directory listing. Trying comprehensive Computer Modern font list...")
@@ -116,11 +166,13 @@ def main():
     
     print(f"Found {len(font_files)} font files to download\n")
     
-    # Download all fonts
-    success_count = 0
-    for font_file in font_files:
-        if download_font(font_file):
-            success_count += 1
+    # Download all fonts concurrently; the work is network-bound
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(lambda f: download_font(session, f), font_files))
+    finally:
+        session.close()
+    success_count = sum(results)
     
     print(f"\n✓ Successfully installed {success_count}/{len(font_files)} fonts")
     print(f"Fonts are now available in: {fonts_dir}")
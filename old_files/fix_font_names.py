@@ -6,6 +6,8 @@ This script creates font copies with uppercase PostScript names.
 """
 import os
 import shutil
+import struct
+from concurrent.futures import ProcessPoolExecutor
 from fontTools.ttLib import TTFont
 
 fonts_dir = os.path.expanduser("~/Library/Fonts")
@@ -38,10 +40,177 @@ font_mapping = {
     'cmu10': 'CMU10',
 }
 
+def _sfnt_checksum(data):
+    """Sum of big-endian uint32 words (zero-padded), as used for sfnt checksums"""
+    data = bytes(data) + b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}L', data)) & 0xFFFFFFFF
+
+def _patch_name_table(data, new_ps_name):
+    """Rebuild a format 0 'name' table with every nameID 6 string replaced.
+    Returns (table bytes, number of records updated)."""
+    fmt, count, string_offset = struct.unpack_from('>HHH', data, 0)
+    if fmt != 0:
+        raise ValueError(f"unsupported name table format {fmt}")
+    
+    header = bytearray(data[:6 + count * 12])
+    struct.pack_into('>H', header, 4, len(header))
+    storage = bytearray()
+    updated_count = 0
+    for i in range(count):
+        record = 6 + i * 12
+        platform_id, encoding_id, _, name_id, length, offset = struct.unpack_from('>6H', data, record)
+        if name_id == 6:
+            if platform_id in (0, 3):
+                string = new_ps_name.encode('utf-16-be')
+            elif platform_id == 1 and encoding_id == 0:
+                string = new_ps_name.encode('mac_roman')
+            else:
+                raise ValueError(f"unsupported name record encoding ({platform_id}, {encoding_id})")
+            updated_count += 1
+        else:
+            start = string_offset + offset
+            if start + length > len(data):
+                raise ValueError("name record points outside the table")
+            string = data[start:start + length]
+        struct.pack_into('>HH', header, record + 8, len(string), len(storage))
+        storage += string
+    return bytes(header + storage), updated_count
+
+def _cff_dict_operators(data, start, end):
+    """Return the set of operators in a CFF DICT, e.g. 17 or (12, 38)"""
+    operators = set()
+    i = start
+    while i < end:
+        b0 = data[i]
+        if b0 == 12:
+            operators.add((12, data[i + 1]))
+            i += 2
+        elif b0 <= 21:
+            operators.add(b0)
+            i += 1
+        elif b0 == 28:
+            i += 3
+        elif b0 == 29:
+            i += 5
+        elif b0 == 30:
+            # Real number: nibbles up to and including an 0xf terminator
+            i += 1
+            while data[i] & 0x0F != 0x0F and data[i] >> 4 != 0x0F:
+                i += 1
+            i += 1
+        elif 32 <= b0 <= 246:
+            i += 1
+        elif 247 <= b0 <= 254:
+            i += 2
+        else:
+            raise ValueError(f"reserved CFF DICT byte {b0}")
+    return operators
+
+def _patch_cff_font_name(data, new_ps_name):
+    """Replace the font name in the CFF Name INDEX. Only same-length names are
+    supported, since a longer or shorter name would shift every CFF offset.
+    Fonts whose Top DICT carries its own FontName are left to fontTools, which
+    can rename that entry as well."""
+    major, _, hdr_size, _ = struct.unpack_from('>4B', data, 0)
+    count, off_size = struct.unpack_from('>HB', data, hdr_size)
+    if major != 1 or count != 1 or not 1 <= off_size <= 4:
+        raise ValueError("unexpected CFF Name INDEX")
+    
+    offsets_start = hdr_size + 3
+    first = int.from_bytes(data[offsets_start:offsets_start + off_size], 'big')
+    last = int.from_bytes(data[offsets_start + off_size:offsets_start + 2 * off_size], 'big')
+    # INDEX offsets are 1-based, relative to the byte before the data area
+    name_start = offsets_start + 2 * off_size - 1 + first
+    new_name = new_ps_name.encode('ascii')
+    if len(new_name) != last - first:
+        raise ValueError("CFF font name length would change")
+    
+    # The Top DICT INDEX (one entry) follows the Name INDEX
+    top_index = name_start + len(new_name)
+    top_count, top_off_size = struct.unpack_from('>HB', data, top_index)
+    if top_count != 1 or not 1 <= top_off_size <= 4:
+        raise ValueError("unexpected CFF Top DICT INDEX")
+    top_offsets = top_index + 3
+    top_first = int.from_bytes(data[top_offsets:top_offsets + top_off_size], 'big')
+    top_last = int.from_bytes(data[top_offsets + top_off_size:top_offsets + 2 * top_off_size], 'big')
+    top_data = top_offsets + 2 * top_off_size - 1
+    if (12, 38) in _cff_dict_operators(data, top_data + top_first, top_data + top_last):
+        raise ValueError("CFF Top DICT has its own FontName")
+    return data[:name_start] + new_name + data[name_start + len(new_name):]
+
+def _fix_font_in_place(font_path, new_ps_name):
+    """Rewrite only the 'name' and 'CFF ' table bytes and stitch the sfnt back
+    together, instead of decompiling and recompiling every table with fontTools.
+    Raises on anything it does not understand so the caller can fall back."""
+    with open(font_path, 'rb') as f:
+        data = f.read()
+    
+    sfnt_version, num_tables = struct.unpack_from('>4sH', data, 0)
+    if sfnt_version not in (b'\0\1\0\0', b'OTTO', b'true'):
+        raise ValueError("not a plain sfnt font")
+    records = [struct.unpack_from('>4sLLL', data, 12 + i * 16) for i in range(num_tables)]
+    tables = {tag: data[offset:offset + length] for tag, _, offset, length in records}
+    checksums = {tag: checksum for tag, checksum, _, _ in records}
+    if len(tables) != num_tables or b'name' not in tables or b'head' not in tables:
+        raise ValueError("unexpected table directory")
+    if any(offset + length > len(data) for _, _, offset, length in records):
+        raise ValueError("table extends past end of file")
+    
+    # Patch everything before printing, so a failure leaves nothing half-reported
+    tables[b'name'], updated_count = _patch_name_table(tables[b'name'], new_ps_name)
+    changed = [b'name']
+    if b'CFF ' in tables:
+        tables[b'CFF '] = _patch_cff_font_name(tables[b'CFF '], new_ps_name)
+        changed.append(b'CFF ')
+    # head.checksumAdjustment (offset 8) is zeroed while checksumming
+    tables[b'head'] = tables[b'head'][:8] + b'\0\0\0\0' + tables[b'head'][12:]
+    changed.append(b'head')
+    for tag in changed:
+        checksums[tag] = _sfnt_checksum(tables[tag])
+    
+    # Lay the tables out in their original file order, each padded to 4 bytes
+    body_start = 12 + 16 * num_tables
+    offsets = {}
+    body = bytearray()
+    for tag, _, _, _ in sorted(records, key=lambda record: record[2]):
+        offsets[tag] = body_start + len(body)
+        body += tables[tag] + b'\0' * (-len(tables[tag]) % 4)
+    
+    font_data = bytearray(data[:12])
+    for tag, _, _, _ in records:
+        font_data += struct.pack('>4sLLL', tag, checksums[tag], offsets[tag], len(tables[tag]))
+    font_data += body
+    adjustment = (0xB1B0AFBA - _sfnt_checksum(font_data)) & 0xFFFFFFFF
+    struct.pack_into('>L', font_data, offsets[b'head'] + 8, adjustment)
+    
+    temp_path = font_path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(font_data)
+        os.replace(temp_path, font_path)
+    except Exception:
+        # Don't leave a partial .tmp font behind in the fonts directory
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    
+    if updated_count > 0:
+        print(f"  Updated {updated_count} PostScript name record(s) to: {new_ps_name}")
+    if b'CFF ' in tables:
+        print(f"  Updated CFF FontName to: {new_ps_name}")
+
 def fix_font_postscript_name(font_path, new_ps_name):
     """Modify the PostScript name in a font file"""
     try:
-        font = TTFont(font_path)
+        _fix_font_in_place(font_path, new_ps_name)
+        return True
+    except Exception as e:
+        print(f"  Patching in place failed ({e}), rewriting with fontTools")
+    
+    temp_path = font_path + '.tmp'
+    try:
+        # lazy=True leaves tables we never touch undecoded; save() copies them as-is
+        font = TTFont(font_path, lazy=True)
         
         # Update PostScript name in 'name' table (nameID 6)
         name_table = font['name']
@@ -57,39 +226,64 @@ def fix_font_postscript_name(font_path, new_ps_name):
         # This is critical for OTF fonts as many applications read from CFF
         if 'CFF ' in font:
             try:
-                cff_table = font['CFF ']
-                # Get the top-level font dictionary
-                top_dict = cff_table.cff.topDictIndex[0]
-                # Update FontName in CFF
-                top_dict.FontName = new_ps_name
+                cff = font['CFF '].cff
+                # The CFF font name lives in the Name INDEX; rename it there,
+                # and in the Top DICT only if the font also carries one
+                cff.fontNames[0] = new_ps_name
+                top_dict = cff.topDictIndex[0]
+                if 'FontName' in top_dict.rawDict:
+                    top_dict.FontName = new_ps_name
                 print(f"  Updated CFF FontName to: {new_ps_name}")
             except Exception as e:
                 print(f"  Warning: Could not update CFF table: {e}")
                 # Continue anyway as name table update is also important
         
-        # Save the modified font
-        font.save(font_path)
+        # Save the modified font. A lazy font still reads from font_path,
+        # so write a temp file and swap it in once the font is closed
+        font.save(temp_path)
+        font.close()
+        os.replace(temp_path, font_path)
         return True
     except Exception as e:
         print(f"  Error: {e}")
+        # Don't leave a partial .tmp font behind in the fonts directory
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
         return False
 
+def _fix_one(job):
+    """Fix one (font_file, font_path, uppercase_name) job; runs in a worker process.
+    Returns True if the font was fixed."""
+    font_file, font_path, uppercase_name = job
+    print(f"Processing {font_file} -> {uppercase_name}...")
+    return fix_font_postscript_name(font_path, uppercase_name)
+
+def list_fonts(directory):
+    """Map each .otf filename in directory to its path, from a single directory scan"""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name: entry.path for entry in entries
+                    if entry.is_file() and entry.name.endswith('.otf')}
+    except FileNotFoundError:
+        return {}
+
 def main():
     print("Fixing PostScript names in Computer Modern fonts...\n")
     
-    fixed_count = 0
+    present = list_fonts(fonts_dir)
+    jobs = []
     not_found = []
-    
     for lowercase_name, uppercase_name in font_mapping.items():
         font_file = f"{lowercase_name}.otf"
-        font_path = os.path.join(fonts_dir, font_file)
-        
-        if os.path.exists(font_path):
-            print(f"Processing {font_file} -> {uppercase_name}...")
-            if fix_font_postscript_name(font_path, uppercase_name):
-                fixed_count += 1
-        else:
+        font_path = present.get(font_file)
+        if font_path is None:
             not_found.append(font_file)
+        else:
+            jobs.append((font_file, font_path, uppercase_name))
+    
+    # Each font is parsed and saved independently, so spread them across cores
+    with ProcessPoolExecutor() as executor:
+        fixed_count = sum(executor.map(_fix_one, jobs))
     
     print(f"\n✓ Fixed {fixed_count} fonts")
     if not_found:
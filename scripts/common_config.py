@@ -0,0 +1,65 @@
+"""
+Shared config.yaml loader for the Python pipeline scripts
+
+Both export_plotnine_fits.py (Step 1) and generate_latex_from_config.py (Step 3)
+read config.yaml. The first load parses the YAML and writes the result next to it
+as config.yaml.cache.json; later loads read that JSON file instead, for as long as
+it is at least as new as config.yaml. Editing config.yaml invalidates the cache
+automatically, so there is nothing to clear by hand.
+
+Usage:
+    from common_config import load_config
+    config = load_config()
+"""
+
+import json
+import os
+import yaml
+
+# Use the libyaml C parser when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+CONFIG_FILE = "../config.yaml"
+
+
+def load_config(config_file=CONFIG_FILE):
+    """Load configuration from config.yaml, via its JSON cache when up to date"""
+    if not os.path.exists(config_file):
+        raise FileNotFoundError(f"config.yaml not found at {config_file}")
+
+    cache_file = config_file + ".cache.json"
+    if (os.path.exists(cache_file)
+            and os.path.getmtime(cache_file) >= os.path.getmtime(config_file)):
+        try:
+            with open(cache_file, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            pass  # Unreadable cache: fall through and rebuild it
+
+    with open(config_file, 'r') as f:
+        config = yaml.load(f, Loader=SafeLoader)
+
+    # Only cache configs that survive a JSON round trip unchanged (JSON has
+    # no dates and turns non-string keys into strings)
+    try:
+        cached = json.dumps(config)
+    except (TypeError, ValueError):
+        return config
+    if json.loads(cached) != config:
+        return config
+
+    # Write via a temp file so a concurrent reader never sees a partial cache.
+    # The cache is only an optimization, so failing to write it is not an error.
+    temp_file = cache_file + ".tmp"
+    try:
+        with open(temp_file, 'w') as f:
+            f.write(cached)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+    return config
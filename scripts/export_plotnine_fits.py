@@ -2,10 +2,10 @@
 """
 Export plotnine GAM fitted values to CSV
 
-This script is Step 1 of the figure generation pipeline. It uses plotnine's 
-geom_smooth with method='auto' (which uses GAM for larger datasets) to fit smooth 
-curves to the data. It then extracts the exact fitted values that plotnine computes 
-and exports them to CSV for use in R.
+This script is Step 1 of the figure generation pipeline. It fits the same smooth 
+curves as plotnine's geom_smooth with method='auto' by calling plotnine's smoother 
+(predictdf) directly, without building or drawing a plot, and exports the fitted 
+values to CSV for use in R.
 
 PIPELINE STEP: 1 of 3
 INPUT:  combined_df.csv
@@ -13,9 +13,9 @@ OUTPUT: plotnine_gam_predictions.csv
 
 The approach:
 1. For each combination of plot_group, variable, and color_var:
-   - Create a plotnine plot with geom_smooth
-   - Draw the plot (which computes the smooth line)
-   - Extract the line data from matplotlib
+   - Transform x to log10 scale and drop values outside the y limits,
+     as scale_x_log10 and scale_y_continuous(limits=...) would
+   - Fit the smooth with plotnine's predictdf (what geom_smooth calls)
    - Convert log-scale x values back to original scale
 2. Combine all predictions and export to CSV
 
@@ -31,13 +31,19 @@ Dependencies:
     See requirements.txt for full list
 """
 
+import os
+
+# Nothing here displays a figure. Pin matplotlib to the non-interactive Agg
+# backend in case a dependency imports it, without importing it ourselves
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
 import pandas as pd
 import numpy as np
-from plotnine import *
-import matplotlib.pyplot as plt
+from plotnine.stats.smoothers import predictdf
 import warnings
-import yaml
-import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from common_config import CONFIG_FILE, load_config
 warnings.filterwarnings('ignore')
 
 # ============================================================================
@@ -45,10 +51,8 @@ warnings.filterwarnings('ignore')
 # ============================================================================
 
 # Load configuration from config.yaml
-CONFIG_FILE = "../config.yaml"
 if os.path.exists(CONFIG_FILE):
-    with open(CONFIG_FILE, 'r') as f:
-        config = yaml.safe_load(f)
+    config = load_config(CONFIG_FILE)
     DATA_FILE = config['paths']['input_data']
     OUTPUT_FILE = config['paths']['gam_predictions']
     SMOOTHING_METHOD = config['step1_python']['smoothing_method']
@@ -91,17 +95,65 @@ ALL_PLOT_COLORS = [
     "#c49c94"                          # Nose and Paws
 ]
 
+# Columns read from the input data and their types; declaring them up front
+# skips pandas' type inference and the columns this script never uses
+INPUT_DTYPES = {
+    'plot_group': 'category',
+    'variable': 'category',
+    'color_var': 'category',
+    'train_label_size': 'float64',
+    'value': 'float64'
+}
+
 # Y-axis limits (for filtering predictions)
 Y_MIN = 0.4
 Y_MAX = 1.0
 
+# Parameters passed to plotnine's smoother; these are stat_smooth's defaults
+# with se=False, as geom_smooth(method='auto', se=False) would use
+SMOOTH_PARAMS = {
+    "method": "auto",
+    "se": False,
+    "n": 80,
+    "formula": None,
+    "fullrange": False,
+    "level": 0.95,
+    "span": 0.75,
+    "method_args": {},
+}
+
 # ============================================================================
 # MAIN SCRIPT
 # ============================================================================
 
+@lru_cache(maxsize=None)
+def loess_available():
+    """Check whether scikit-misc's loess can be imported. Python does not cache
+    failed imports, so remember the result here instead of retrying per subset."""
+    try:
+        from skmisc.loess import loess  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def resolve_smoothing_method(n_points):
+    """
+    Resolve method='auto' the way plotnine's stat_smooth does: loess (or lowess
+    when scikit-misc is not installed) below 1000 points, glm otherwise.
+    
+    Small subsets deliberately take the same path rather than a cheaper
+    polynomial fit, since plotnine itself uses loess/lowess for any n < 1000
+    and the exported curves must match what geom_smooth would draw.
+    """
+    if n_points >= 1000:
+        return "glm"
+    return "loess" if loess_available() else "lowess"
+
+
 def extract_smooth_data(subset_data, color_var, variable, plot_group):
     """
-    Extract smooth line data from plotnine for a single data subset.
+    Compute the smooth line plotnine would draw for a single data subset.
     
     Parameters:
     -----------
@@ -123,48 +175,44 @@ def extract_smooth_data(subset_data, color_var, variable, plot_group):
         return None
     
     try:
-        # Create plotnine plot with geom_smooth (same as Old_Python_Code.txt)
-        # This uses GAM smoothing for larger datasets
-        p = (ggplot(subset_data, aes(x='train_label_size', y='value'))
-             + geom_smooth(alpha=0, method='auto', se=False)
-             + scale_x_log10()
-             + scale_y_continuous(limits=(Y_MIN, Y_MAX)))
+        # Apply the plot's scales before fitting: scale_x_log10 transforms x,
+        # and the y limits turn out-of-range values into NaN, which
+        # stat_smooth then drops along with any other non-finite points
+        data = pd.DataFrame({
+            'x': np.log10(subset_data['train_label_size'].to_numpy(dtype=float)),
+            'y': subset_data['value'].to_numpy(dtype=float)
+        })
+        in_limits = (data['y'] >= Y_MIN) & (data['y'] <= Y_MAX)
+        data = data[in_limits & np.isfinite(data['x']) & np.isfinite(data['y'])]
+        data = data.sort_values('x')
         
-        # Draw the plot to compute the smooth line
-        fig = p.draw()
+        if data['x'].nunique() < 2:
+            return None
         
-        # Extract line data from matplotlib
-        if len(fig.axes) > 0:
-            ax = fig.axes[0]
-            lines = ax.get_lines()
-            
-            for line in lines:
-                x_data = line.get_xdata()
-                y_data = line.get_ydata()
-                
-                if len(x_data) > 0 and len(y_data) > 0:
-                    # Filter to valid y range
-                    valid_mask = (y_data >= Y_MIN) & (y_data <= Y_MAX)
-                    
-                    if valid_mask.sum() > 0:
-                        # Convert x_data back from log scale to original scale
-                        # matplotlib stores log-transformed values when using scale_x_log10
-                        x_original = 10**x_data[valid_mask]
-                        
-                        pred_df = pd.DataFrame({
-                            'train_label_size': x_original,
-                            'predicted': y_data[valid_mask],
-                            'color_var': color_var,
-                            'variable': variable,
-                            'plot_group': plot_group
-                        })
-                        
-                        # Close figure to free memory
-                        plt.close(fig)
-                        return pred_df
+        params = dict(SMOOTH_PARAMS, method_args={})
+        if params['method'] == 'auto':
+            params['method'] = resolve_smoothing_method(len(data))
+        xseq = np.linspace(data['x'].min(), data['x'].max(), params['n'])
+        smooth = predictdf(data, xseq, params)
         
-        plt.close(fig)
-        return None
+        x_data = smooth['x'].to_numpy()
+        y_data = smooth['y'].to_numpy()
+        
+        # Filter to valid y range
+        valid_mask = (y_data >= Y_MIN) & (y_data <= Y_MAX)
+        if valid_mask.sum() == 0:
+            return None
+        
+        # Convert x_data back from log scale to original scale
+        x_original = 10**x_data[valid_mask]
+        
+        return pd.DataFrame({
+            'train_label_size': x_original,
+            'predicted': y_data[valid_mask],
+            'color_var': color_var,
+            'variable': variable,
+            'plot_group': plot_group
+        })
         
     except Exception as e:
         print(f"  ✗ Error for {plot_group}, {variable}, {color_var}: {e}")
@@ -179,37 +227,32 @@ def main():
     
     # Read the data
     print(f"\n1. Reading data from {DATA_FILE}...")
-    combined_df = pd.read_csv(DATA_FILE)
+    combined_df = pd.read_csv(DATA_FILE, engine='c', usecols=list(INPUT_DTYPES),
+                              dtype=INPUT_DTYPES)
     print(f"   Loaded {len(combined_df)} data points")
     
     # Extract fitted values group by group
-    print("\n2. Extracting smooth line data from plotnine (group by group)...")
+    print("\n2. Fitting smooth lines with plotnine's smoother (group by group)...")
     all_predictions = []
-    all_plot_groups = combined_df['plot_group'].unique()
-    
-    total_combinations = 0
     successful = 0
     
-    for group in all_plot_groups:
-        group_data = combined_df[combined_df['plot_group'] == group].copy()
-        unique_vars = group_data['variable'].unique()
-        unique_colors = group_data['color_var'].unique()
-        
-        for var in unique_vars:
-            for color in unique_colors:
-                total_combinations += 1
-                
-                subset_data = group_data[
-                    (group_data['variable'] == var) & 
-                    (group_data['color_var'] == color)
-                ].copy()
-                
-                pred_df = extract_smooth_data(subset_data, color, var, group)
-                
-                if pred_df is not None:
-                    all_predictions.append(pred_df)
-                    successful += 1
-                    print(f"   ✓ {group}, {var}, {color}: {len(pred_df)} points")
+    # One pass over the data splits it into (plot_group, variable, color_var)
+    # subsets; only the two fitted columns are sent to the workers
+    grouped = combined_df.groupby(['plot_group', 'variable', 'color_var'],
+                                  sort=False, observed=True)
+    jobs = [(subset_data[['train_label_size', 'value']], color, var, group)
+            for (group, var, color), subset_data in grouped]
+    total_combinations = len(jobs)
+    
+    # Each fit is independent and CPU-bound, so spread them across cores
+    with ProcessPoolExecutor() as executor:
+        results = list(executor.map(extract_smooth_data, *zip(*jobs)))
+    
+    for (_, color, var, group), pred_df in zip(jobs, results):
+        if pred_df is not None:
+            all_predictions.append(pred_df)
+            successful += 1
+            print(f"   ✓ {group}, {var}, {color}: {len(pred_df)} points")
     
     print(f"\n   Extracted {successful}/{total_combinations} combinations")
     
@@ -218,6 +261,11 @@ def main():
     if all_predictions:
         predictions_df = pd.concat(all_predictions, ignore_index=True)
         
+        # Label columns as categoricals: duplicate detection and sorting work on
+        # integer codes, and categories are sorted, so the row order is unchanged
+        for column in ['plot_group', 'variable', 'color_var']:
+            predictions_df[column] = predictions_df[column].astype('category')
+        
         # Remove duplicates and sort
         predictions_df = predictions_df.drop_duplicates().sort_values(
             ['plot_group', 'variable', 'color_var', 'train_label_size']
@@ -9,17 +9,7 @@ Usage:
     python generate_latex_from_config.py
 """
 
-import yaml
-import os
-
-def load_config():
-    """Load configuration from config.yaml"""
-    config_file = "../config.yaml"
-    if not os.path.exists(config_file):
-        raise FileNotFoundError(f"config.yaml not found at {config_file}")
-    
-    with open(config_file, 'r') as f:
-        return yaml.safe_load(f)
+from common_config import load_config
 
 def format_f1_score(f1, bold=False):
     """Format F1 score for LaTeX"""
@@ -27,39 +17,39 @@ def format_f1_score(f1, bold=False):
         return f"\\textbf{{{f1}}}"
     return str(f1)
 
-def generate_table_rows(config):
-    """Generate LaTeX table rows from config"""
+def _emit_rows(config):
+    """Yield LaTeX table lines, one section at a time"""
     table_data = config['table_data']
     sections = config['step3_latex']['table_sections']
     color_square_size = config['step3_latex']['color_square_size']
     icon_size = config['step3_latex']['icon_size']
-    row_light = config['step3_latex']['table_colors']['row_light']
+    last_section = sections[-1] if sections else None
     
-    rows = []
     for section in sections:
         section_key = section.lower().replace(" ", "_")
-        rows.append(f"                % ============================================================")
-        rows.append(f"                % {section.upper()} SECTION")
-        rows.append(f"                % ============================================================")
-        rows.append(f"                \\multicolumn{{4}}{{l}}{{\\textit{{{section}}}}} \\\\")
-        rows.append(f"                \\midrule")
+        yield "                % ============================================================"
+        yield f"                % {section.upper()} SECTION"
+        yield "                % ============================================================"
+        yield f"                \\multicolumn{{4}}{{l}}{{\\textit{{{section}}}}} \\\\"
+        yield "                \\midrule"
         
-        items = table_data.get(section_key, [])
-        for i, item in enumerate(items):
+        for i, item in enumerate(table_data.get(section_key, [])):
             row_color = "\\rowcolor{rowlight}" if i % 2 == 0 else ""
             color_hex = item['color'].replace('#', '')
             icon_file = item['icon']
             name = item['name']
             f1 = format_f1_score(item['f1'], item.get('bold', False))
             
-            rows.append(f"                {row_color}")
-            rows.append(f"                \\textcolor[HTML]{{{color_hex}}}{{\\rule{{{color_square_size}}}{{{color_square_size}}}}} & \\includegraphics[width={icon_size}]{{../icons/{icon_file}}} & {name} & {f1} \\\\")
+            yield f"                {row_color}"
+            yield f"                \\textcolor[HTML]{{{color_hex}}}{{\\rule{{{color_square_size}}}{{{color_square_size}}}}} & \\includegraphics[width={icon_size}]{{../icons/{icon_file}}} & {name} & {f1} \\\\"
         
-        if section != sections[-1]:  # Not the last section
-            rows.append(f"                \\midrule")
-            rows.append("")
-    
-    return "\n".join(rows)
+        if section != last_section:  # Not the last section
+            yield "                \\midrule"
+            yield ""
+
+def generate_table_rows(config):
+    """Generate LaTeX table rows from config"""
+    return "\n".join(_emit_rows(config))
 
 def generate_latex(config):
     """Generate LaTeX document from config"""